@@ -7,9 +7,15 @@
 """
 
 import json
+import math
+import queue
+import shutil
+import subprocess
+import threading
 import numpy as np
 from pathlib import Path
 import argparse
+from functools import lru_cache
 from typing import Dict, List, Tuple
 import cv2
 
@@ -21,6 +27,134 @@ except ImportError:
     print("请运行: pip install pyrender trimesh")
     raise
 
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时回退到标准库json
+    orjson = None
+
+
+# ffmpeg可执行文件路径（未安装时为None，回退到cv2.VideoWriter）
+FFMPEG_BIN = shutil.which("ffmpeg")
+
+
+@lru_cache(maxsize=None)
+def ffmpeg_h264_args():
+    """
+    选择H.264编码参数：有可用的NVENC硬件编码器时使用h264_nvenc，否则使用多线程libx264
+    
+    仅在编码器列表中出现nvenc还不够（可能没有GPU/驱动），因此额外试编码一帧确认可用。
+    """
+    software_args = ['-c:v', 'libx264', '-preset', 'veryfast', '-threads', '0', '-pix_fmt', 'yuv420p']
+    nvenc_args = ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'll', '-pix_fmt', 'yuv420p']
+    
+    try:
+        encoders = subprocess.run(
+            [FFMPEG_BIN, '-hide_banner', '-encoders'],
+            capture_output=True, text=True, timeout=10,
+        ).stdout
+        if 'h264_nvenc' not in encoders:
+            return software_args
+        probe = subprocess.run(
+            [FFMPEG_BIN, '-hide_banner', '-loglevel', 'error',
+             '-f', 'lavfi', '-i', 'color=size=256x256', '-frames:v', '1',
+             *nvenc_args, '-f', 'null', '-'],
+            capture_output=True, timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return software_args
+    
+    return nvenc_args if probe.returncode == 0 else software_args
+
+
+# GIF编码参数：逐帧生成调色板并映射（palettegen/paletteuse），无限循环播放。
+# 全局调色板要到输入结束时才生成，ffmpeg必须缓存全部帧；逐帧调色板可以边接收边编码，内存占用恒定
+FFMPEG_GIF_ARGS = [
+    '-vf', 'split[a][b];[a]palettegen=stats_mode=single[p];[b][p]paletteuse=new=1',
+    '-loop', '0',
+]
+
+
+def _nulls_to_nan(episode_data):
+    """
+    把episode数据中逐步记录的null数值恢复为NaN（视为缺失值）
+    
+    run_exp_for_render.py使用orjson保存时把NaN/Inf写为null，而json.dump写为NaN；
+    恢复后与原先读回的数据一致，后续的数组计算和文本格式化无需处理None。
+    """
+    nan = float('nan')
+    for key, fields in (("robot_trajectory", ("x", "y", "theta")), ("actions", ("linear", "angular"))):
+        for item in episode_data.get(key, []):
+            for field in fields:
+                if field in item and item[field] is None:
+                    item[field] = nan
+    
+    for traj in episode_data.get("obstacle_trajectories", {}).values():
+        for pos in traj:
+            for field in ("x", "y"):
+                if field in pos and pos[field] is None:
+                    pos[field] = nan
+            velocity = pos.get("velocity")
+            if velocity is not None and None in velocity:
+                pos["velocity"] = [nan if v is None else v for v in velocity]
+
+
+class FFmpegVideoWriter:
+    """
+    通过管道把原始RGB帧直接写入ffmpeg子进程编码
+    
+    接口与cv2.VideoWriter保持一致（isOpened/write/release），但write接收RGB帧，
+    省去了OpenCV/imageio封装层和逐帧的BGR转换。
+    """
+    
+    def __init__(self, path, width, height, fps, output_args=None):
+        """
+        Args:
+            path: 输出文件路径
+            width: 帧宽度
+            height: 帧高度
+            fps: 帧率
+            output_args: 输出编码参数（默认由ffmpeg_h264_args选择）
+        """
+        if output_args is None:
+            output_args = ffmpeg_h264_args()
+        
+        cmd = [
+            FFMPEG_BIN, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+            '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', '-',
+            *output_args,
+            str(path),
+        ]
+        self._proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20
+        )
+    
+    def isOpened(self):
+        return self._proc.poll() is None
+    
+    def write(self, frame_rgb):
+        # 通过memoryview零拷贝写入管道，避免tobytes()复制整帧
+        frame_rgb = np.ascontiguousarray(frame_rgb)
+        self._proc.stdin.write(memoryview(frame_rgb).cast('B'))
+    
+    def release(self):
+        """关闭管道并等待ffmpeg结束，编码失败时抛出RuntimeError（含退出码和ffmpeg的错误信息）"""
+        if self._proc.stdin.closed:
+            return
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg已提前退出，缓冲区中剩余的数据无法写入，失败原因见下面的退出码和错误信息
+            pass
+        err = self._proc.stderr.read()
+        self._proc.wait()
+        if self._proc.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg编码失败（退出码 {self._proc.returncode}）: {err.decode(errors='ignore').strip()}"
+            )
+
 
 class Renderer2Dto3D:
     """使用PyRender将2D数据渲染为3D第一人称视频的渲染器"""
@@ -76,6 +210,31 @@ class Renderer2Dto3D:
         self.scene_dir = self.output_dir / f"seed_{seed}" / f"scene_{scene_id:05d}"
         self.scene_dir.mkdir(parents=True, exist_ok=True)
         
+        # 机器人轨迹一次性转换为SoA格式的float32数组，避免逐帧的dict查找
+        robot_traj = self.episode_data.get("robot_trajectory", [])
+        self._traj_x = np.array([p["x"] for p in robot_traj], dtype=np.float32)
+        self._traj_y = np.array([p["y"] for p in robot_traj], dtype=np.float32)
+        self._traj_theta = np.array([p["theta"] for p in robot_traj], dtype=np.float32)
+        self._traj_len = len(robot_traj)
+        
+        # 指南针几何参数，并一次性向量化计算所有帧的箭头终点
+        self._compass_x = image_width - 70
+        self._compass_y = 50
+        self._compass_radius = 30
+        arrow_length = self._compass_radius - 8
+        phi = self._traj_theta.astype(np.float64) - np.pi / 2
+        self._arrow_end_x = np.floor(self._compass_x + arrow_length * np.cos(phi)).astype(np.int32)
+        self._arrow_end_y = np.floor(self._compass_y + arrow_length * np.sin(phi)).astype(np.int32)
+        
+        # 指南针半透明背景圆：只预先计算其外接矩形区域和区域内的圆形掩码
+        self._compass_shade = self._build_compass_shade()
+        
+        # 所有帧的UI文本在初始化时一次性格式化，渲染时直接按帧索引
+        self._ui_texts = self._build_ui_texts()
+        
+        # 天空渐变背景与帧无关，只生成一次
+        self._sky_bg = self._build_sky_background()
+        
         # 初始化PyRender渲染器（离线模式）
         self.renderer = pyrender.OffscreenRenderer(image_width, image_height)
     
@@ -268,85 +427,76 @@ class Renderer2Dto3D:
             print("警告: 没有机器人轨迹数据")
             return None
         
-        # 创建视频
+        # 创建视频（优先通过管道写入ffmpeg，未安装时回退到cv2.VideoWriter）
         video_file = self.scene_dir / f"{self.episode_id}.mp4"
+        if FFMPEG_BIN is not None:
+            codec_args = ffmpeg_h264_args()
+            out = FFmpegVideoWriter(video_file, self.image_width, self.image_height, self.fps,
+                                    output_args=codec_args)
+            print(f"使用视频编码器: ffmpeg ({codec_args[1]})")
+        else:
+            out = self._open_cv2_video_writer(video_file)
+        
+        # GIF与MP4共用同一份渲染结果：每隔一帧同时送入第二个ffmpeg进程编码GIF，
+        # 不在内存中保留整段帧序列；未安装ffmpeg时才收集帧并在结束后用PIL保存
+        gif_file = self.scene_dir / f"{self.episode_id}.gif"
+        gif_out = None
+        gif_frames = None
+        if also_save_gif:
+            if FFMPEG_BIN is not None:
+                gif_out = FFmpegVideoWriter(gif_file, self.image_width, self.image_height,
+                                            self.fps / 2, output_args=FFMPEG_GIF_ARGS)
+            else:
+                gif_frames = []
         
-        # 尝试多种编码器
-        codecs_to_try = [
-            ('avc1', 'H.264 (avc1)'),
-            ('H264', 'H.264 (H264)'),
-            ('X264', 'H.264 (X264)'),
-            ('mp4v', 'MPEG-4'),
-        ]
+        # 为每一帧渲染第一人称视图
+        # 主线程只负责PyRender渲染（GPU），UI绘制和视频编码（CPU）在写入线程中进行，
+        # 两者通过有界队列重叠执行
+        frame_queue = queue.Queue(maxsize=8)
+        writer_state = {"frames_written": 0, "gif_frames_written": 0, "error": None}
+        writer_thread = threading.Thread(
+            target=self._write_frames_worker,
+            args=(frame_queue, out, gif_out, gif_frames, writer_state),
+            daemon=True,
+        )
+        writer_thread.start()
         
-        out = None
-        for codec, codec_name in codecs_to_try:
-            try:
-                fourcc = cv2.VideoWriter_fourcc(*codec)
-                out = cv2.VideoWriter(
-                    str(video_file), 
-                    fourcc, 
-                    self.fps, 
-                    (self.image_width, self.image_height)
+        try:
+            for step_idx in range(self._traj_len):
+                # 写入线程出错后不再继续渲染剩余帧，尽早结束并抛出异常
+                if writer_state["error"] is not None:
+                    break
+                
+                color = self._render_first_person_frame_pyrender(
+                    obstacle_trajs, 
+                    initial_obstacles,
+                    step_idx
                 )
+                frame_queue.put((step_idx, color))
                 
-                if out.isOpened():
-                    print(f"使用视频编码器: {codec_name}")
-                    break
-                else:
-                    out.release()
-                    out = None
-            except Exception:
-                if out:
-                    out.release()
-                out = None
-                continue
-        
-        if out is None or not out.isOpened():
-            print("警告: 无法初始化视频编码器")
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(
-                str(video_file), 
-                fourcc, 
-                self.fps, 
-                (self.image_width, self.image_height)
-            )
-        
-        # 为每一帧渲染第一人称视图
-        frames_written = 0
-        all_frames_bgr = []
-        
-        for step_idx, robot_pos in enumerate(robot_traj):
-            frame = self._render_first_person_frame_pyrender(
-                robot_pos, 
-                obstacle_trajs, 
-                initial_obstacles,
-                step_idx
-            )
-            
-            # 转换为BGR格式（OpenCV格式）
-            frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            
-            # 写入视频
-            if out and out.isOpened():
-                out.write(frame_bgr)
-                frames_written += 1
-            
-            # 保存帧用于GIF
-            if also_save_gif and step_idx % 2 == 0:
-                all_frames_bgr.append(frame_bgr)
-            
-            # 保存关键帧的图片
-            if step_idx % 10 == 0:
-                frame_file = self.scene_dir / f"frame_{step_idx}.jpg"
-                cv2.imwrite(str(frame_file), frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                if (step_idx + 1) % 10 == 0:
+                    print(f"已渲染 {step_idx + 1}/{len(robot_traj)} 帧")
+        finally:
+            frame_queue.put(None)
+            writer_thread.join()
             
-            if (step_idx + 1) % 10 == 0:
-                print(f"已渲染 {step_idx + 1}/{len(robot_traj)} 帧")
-        
-        # 释放视频写入器
-        if out:
-            out.release()
+            # 释放视频写入器：逐个释放并打印ffmpeg的错误信息，一个写入器失败时另一个仍会被释放
+            release_errors = []
+            for writer in (out, gif_out):
+                if not writer:
+                    continue
+                try:
+                    writer.release()
+                except RuntimeError as e:
+                    print(f"错误: {e}")
+                    release_errors.append(e)
+        
+        # 优先抛出写入线程中的异常，其次是编码器退出时的错误
+        if writer_state["error"] is not None:
+            raise writer_state["error"]
+        if release_errors:
+            raise release_errors[0]
+        frames_written = writer_state["frames_written"]
         
         # 验证视频文件
         if video_file.exists():
@@ -361,14 +511,11 @@ class Renderer2Dto3D:
             print(f"错误: 视频文件未生成: {video_file}")
             video_file = None
         
-        # 保存GIF动画
-        gif_file = None
-        if also_save_gif and len(all_frames_bgr) > 0:
+        # 保存GIF动画（ffmpeg已在渲染过程中编码完成，这里只处理PIL回退）
+        if gif_frames:
             print("\n生成GIF动画...")
-            gif_file = self.scene_dir / f"{self.episode_id}.gif"
-            
             from PIL import Image
-            pil_frames = [Image.fromarray(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)) for f in all_frames_bgr]
+            pil_frames = [Image.fromarray(f) for f in gif_frames]
             
             pil_frames[0].save(
                 str(gif_file),
@@ -377,18 +524,19 @@ class Renderer2Dto3D:
                 duration=int(1000 / (self.fps / 2)),
                 loop=0
             )
-            
-            if gif_file.exists():
-                gif_size = gif_file.stat().st_size
-                print(f"GIF动画已保存: {gif_file}")
-                print(f"  - 总帧数: {len(pil_frames)}")
-                print(f"  - 文件大小: {gif_size / 1024:.2f} KB")
+        
+        if also_save_gif and gif_file.exists():
+            gif_size = gif_file.stat().st_size
+            print(f"GIF动画已保存: {gif_file}")
+            print(f"  - 总帧数: {writer_state['gif_frames_written']}")
+            print(f"  - 文件大小: {gif_size / 1024:.2f} KB")
+        else:
+            gif_file = None
         
         return video_file if video_file else gif_file
     
     def _render_first_person_frame_pyrender(
         self, 
-        robot_pos: Dict, 
         obstacle_trajs: Dict, 
         initial_obstacles: List,
         step_idx: int
@@ -402,9 +550,9 @@ class Renderer2Dto3D:
         scene = pyrender.Scene(ambient_light=[0.3, 0.3, 0.3])
         
         # 机器人位置和朝向
-        robot_x = robot_pos["x"]
-        robot_y = robot_pos["y"]
-        robot_theta = robot_pos["theta"]
+        robot_x = float(self._traj_x[step_idx])
+        robot_y = float(self._traj_y[step_idx])
+        robot_theta = float(self._traj_theta[step_idx])
         
         # 添加棋盘格地面（更容易看出移动方向）
         self._add_checkered_floor_to_scene(scene, robot_x, robot_y)
@@ -475,7 +623,7 @@ class Renderer2Dto3D:
             scene.add(pyrender.Mesh.from_trimesh(mesh), pose=pose)
         
         # 设置相机（第一人称视角）
-        camera = pyrender.PerspectiveCamera(yfov=np.radians(self.fov))
+        camera = pyrender.PerspectiveCamera(yfov=math.radians(self.fov))
         
         # 相机姿态：从机器人位置和朝向计算
         # PyRender使用的坐标系：+X右，+Y上，-Z前（相机看向-Z）
@@ -498,12 +646,113 @@ class Renderer2Dto3D:
         color, depth = self.renderer.render(scene)
         
         # 添加天空背景（PyRender默认黑色背景，我们需要替换）
+        # UI信息覆盖层在写入线程中绘制，见 _write_frames_worker
         color = self._add_sky_background(color, depth)
         
-        # 添加UI信息覆盖层（使用OpenCV绘制）
-        frame_with_ui = self._draw_ui_overlay(color, robot_pos, step_idx)
+        return color
+    
+    def _open_cv2_video_writer(self, video_file):
+        """未安装ffmpeg时，使用cv2.VideoWriter依次尝试多种编码器"""
+        codecs_to_try = [
+            ('avc1', 'H.264 (avc1)'),
+            ('H264', 'H.264 (H264)'),
+            ('X264', 'H.264 (X264)'),
+            ('mp4v', 'MPEG-4'),
+        ]
+        
+        out = None
+        for codec, codec_name in codecs_to_try:
+            try:
+                fourcc = cv2.VideoWriter_fourcc(*codec)
+                out = cv2.VideoWriter(
+                    str(video_file), 
+                    fourcc, 
+                    self.fps, 
+                    (self.image_width, self.image_height)
+                )
+                
+                if out.isOpened():
+                    print(f"使用视频编码器: {codec_name}")
+                    break
+                else:
+                    out.release()
+                    out = None
+            except Exception:
+                if out:
+                    out.release()
+                out = None
+                continue
         
-        return frame_with_ui
+        if out is None or not out.isOpened():
+            print("警告: 无法初始化视频编码器")
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(
+                str(video_file), 
+                fourcc, 
+                self.fps, 
+                (self.image_width, self.image_height)
+            )
+        
+        return out
+    
+    def _write_frames_worker(self, frame_queue, out, gif_out, gif_frames, writer_state):
+        """
+        写入线程：从队列取出渲染结果，绘制UI覆盖层并写入视频/GIF/关键帧
+        
+        队列中的元素为 (step_idx, color)，收到 None 时结束。
+        出错时（包括ffmpeg进程提前退出）记录异常并继续清空队列，避免阻塞渲染线程；
+        渲染线程检查到异常后停止渲染剩余帧。
+        
+        Args:
+            gif_out: GIF的ffmpeg写入器（不保存GIF或未安装ffmpeg时为None）
+            gif_frames: 未安装ffmpeg时收集GIF帧（RGB）的列表，否则为None
+        """
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                break
+            if writer_state["error"] is not None:
+                continue
+            
+            step_idx, color = item
+            try:
+                # 添加UI信息覆盖层（使用OpenCV绘制）
+                frame = self._draw_ui_overlay(color, step_idx)
+                
+                # BGR格式（OpenCV格式）只在cv2写入器或保存关键帧时才需要，按需转换
+                frame_bgr = None
+                
+                # 写入视频（ffmpeg管道直接接收RGB帧）
+                if isinstance(out, FFmpegVideoWriter):
+                    # ffmpeg进程提前退出时报错，而不是静默丢弃后续帧
+                    if not out.isOpened():
+                        raise RuntimeError("ffmpeg视频编码进程已提前退出")
+                    out.write(frame)
+                    writer_state["frames_written"] += 1
+                elif out and out.isOpened():
+                    frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                    out.write(frame_bgr)
+                    writer_state["frames_written"] += 1
+                
+                # 每隔一帧写入GIF（与视频共用同一帧）
+                if step_idx % 2 == 0:
+                    if gif_out is not None:
+                        if not gif_out.isOpened():
+                            raise RuntimeError("ffmpeg GIF编码进程已提前退出")
+                        gif_out.write(frame)
+                        writer_state["gif_frames_written"] += 1
+                    elif gif_frames is not None:
+                        gif_frames.append(frame)
+                        writer_state["gif_frames_written"] += 1
+                
+                # 保存关键帧的图片
+                if step_idx % 10 == 0:
+                    if frame_bgr is None:
+                        frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                    frame_file = self.scene_dir / f"frame_{step_idx}.jpg"
+                    cv2.imwrite(str(frame_file), frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            except Exception as e:
+                writer_state["error"] = e
     
     def _create_pose(self, translation, rotation_euler):
         """
@@ -522,21 +771,26 @@ class Renderer2Dto3D:
         rx, ry, rz = rotation_euler
         
         # 旋转矩阵（ZYX顺序）
+        # 标量三角函数使用math，避免NumPy ufunc对单个数值的调度开销
+        cx, sx = math.cos(rx), math.sin(rx)
+        cy, sy = math.cos(ry), math.sin(ry)
+        cz, sz = math.cos(rz), math.sin(rz)
+        
         Rx = np.array([
             [1, 0, 0],
-            [0, np.cos(rx), -np.sin(rx)],
-            [0, np.sin(rx), np.cos(rx)]
+            [0, cx, -sx],
+            [0, sx, cx]
         ])
         
         Ry = np.array([
-            [np.cos(ry), 0, np.sin(ry)],
+            [cy, 0, sy],
             [0, 1, 0],
-            [-np.sin(ry), 0, np.cos(ry)]
+            [-sy, 0, cy]
         ])
         
         Rz = np.array([
-            [np.cos(rz), -np.sin(rz), 0],
-            [np.sin(rz), np.cos(rz), 0],
+            [cz, -sz, 0],
+            [sz, cz, 0],
             [0, 0, 1]
         ])
         
@@ -567,8 +821,8 @@ class Renderer2Dto3D:
         
         # 计算相机的朝向向量（在世界坐标系中）
         # 机器人theta=0时朝向+X，theta=π/2时朝向+Y
-        forward_x = np.cos(theta)
-        forward_y = np.sin(theta)
+        forward_x = math.cos(theta)
+        forward_y = math.sin(theta)
         
         # 相机坐标系的三个轴在世界坐标系中的表示
         # 相机看向的方向（-Z在相机坐标系）= 机器人前方（XY平面）
@@ -647,8 +901,8 @@ class Renderer2Dto3D:
         color_dark = [100, 100, 90, 255]    # 深灰色
         
         # 计算机器人所在的网格位置
-        robot_grid_x = int(np.floor(robot_x / tile_size))
-        robot_grid_y = int(np.floor(robot_y / tile_size))
+        robot_grid_x = math.floor(robot_x / tile_size)
+        robot_grid_y = math.floor(robot_y / tile_size)
         
         # 收集浅色和深色方块的位置，然后合并
         light_tiles = []
@@ -697,15 +951,10 @@ class Renderer2Dto3D:
     def _add_boundary_walls_to_scene(self, scene):
         """添加场景边界墙（带条纹纹理）"""
         # 计算场景范围
-        robot_traj = self.episode_data.get("robot_trajectory", [])
         initial_obstacles = self.episode_data.get("initial_obstacles", [])
         
-        all_x = []
-        all_y = []
-        
-        if robot_traj:
-            all_x.extend([pos["x"] for pos in robot_traj])
-            all_y.extend([pos["y"] for pos in robot_traj])
+        all_x = self._traj_x.tolist()
+        all_y = self._traj_y.tolist()
         
         for obs in initial_obstacles:
             center = obs.get("initial_center", [0, 0])
@@ -769,15 +1018,12 @@ class Renderer2Dto3D:
     
     def _add_goal_marker_to_scene(self, scene):
         """标记目标终点位置"""
-        robot_traj = self.episode_data.get("robot_trajectory", [])
-        
-        if not robot_traj:
+        if self._traj_len == 0:
             return
         
         # 获取终点位置（轨迹最后一个点）
-        goal_pos = robot_traj[-1]
-        goal_x = goal_pos["x"]
-        goal_y = goal_pos["y"]
+        goal_x = float(self._traj_x[-1])
+        goal_y = float(self._traj_y[-1])
         
         # 创建高大的目标标记（金色高塔）
         marker_height = 6.0
@@ -844,66 +1090,51 @@ class Renderer2Dto3D:
             scene.add(pyrender.Mesh.from_trimesh(marker_mesh),
                      pose=self._create_pose([world_x, world_y, landmark_height + 0.3], [0, 0, 0]))
     
+    def _build_sky_background(self):
+        """生成天空渐变背景图像 (H, W, 3)"""
+        # 从顶部深蓝到底部浅蓝：先向量化计算每一行的颜色 (H, 1, 3)，
+        # 再由OpenCV把这一列平铺到整幅图像宽度
+        t = np.arange(self.image_height)[:, None] / self.image_height
+        top = np.array([200, 180, 135])     # R, G, B
+        bottom = np.array([240, 220, 190])
+        sky_column = (top + (bottom - top) * t).astype(np.uint8)[:, None, :]
+        
+        return cv2.repeat(sky_column, 1, self.image_width)
+    
     def _add_sky_background(self, color_img, depth_img):
         """添加天空背景到渲染图像"""
-        # 创建可写副本（PyRender 返回的数组是只读的）
-        color_img = color_img.copy()
-        
-        # 创建天空渐变
-        sky_gradient = np.zeros_like(color_img)
-        
-        for y in range(self.image_height):
-            t = y / self.image_height
-            # 从顶部深蓝到底部浅蓝
-            sky_color = np.array([
-                int(200 + (240 - 200) * t),  # R
-                int(180 + (220 - 180) * t),  # G
-                int(135 + (190 - 135) * t),  # B
-            ])
-            sky_gradient[y, :] = sky_color
+        # PyRender 返回的数组是只读的：能直接置为可写就原地修改，
+        # 只有底层缓冲区本身不可写时才复制
+        if not color_img.flags.writeable:
+            try:
+                color_img.setflags(write=True)
+            except ValueError:
+                color_img = color_img.copy()
         
         # 在没有深度的地方（背景）使用天空
-        # depth为0表示没有物体
+        # depth为0表示没有物体；copyto按掩码原地写入，不产生花式索引的临时数组
         background_mask = (depth_img == 0)
-        color_img[background_mask] = sky_gradient[background_mask]
+        np.copyto(color_img, self._sky_bg, where=background_mask[..., None])
         
         return color_img
     
-    def _draw_ui_overlay(self, frame, robot_pos, step_idx):
+    def _draw_ui_overlay(self, frame, step_idx):
         """在渲染图像上绘制UI信息覆盖层"""
-        # 确保数组是可写的
-        if not frame.flags.writeable:
-            frame = frame.copy()
-        frame_copy = frame.copy()
-        
-        # 获取机器人轨迹信息
-        robot_traj = self.episode_data.get('robot_trajectory', [])
-        info_text = f"Frame: {step_idx + 1}/{len(robot_traj)}"
-        
-        pos_text = f"Pos: ({robot_pos['x']:.2f}, {robot_pos['y']:.2f})"
-        theta_text = f"Theta: {np.rad2deg(robot_pos['theta']):.1f} deg"
-        
-        if step_idx < len(self.episode_data.get('actions', [])):
-            action = self.episode_data['actions'][step_idx]
-            vel_text = f"Linear: {action['linear']:.2f} m/s"
-            ang_text = f"Angular: {action['angular']:.2f} rad/s"
-        else:
-            vel_text = "Linear: 0.00 m/s"
-            ang_text = "Angular: 0.00 rad/s"
+        # 获取预先格式化好的机器人轨迹信息
+        texts = self._ui_texts[step_idx]
         
-        # 转换为BGR用于OpenCV绘制
-        frame_bgr = cv2.cvtColor(frame_copy, cv2.COLOR_RGB2BGR)
+        # 转换为BGR用于OpenCV绘制（cvtColor输出新数组，输入帧无需复制或可写）
+        frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
         
-        # 绘制半透明背景
-        overlay = frame_bgr.copy()
-        cv2.rectangle(overlay, (10, 10), (300, 130), (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.6, frame_bgr, 0.4, 0, frame_bgr)
+        # 绘制半透明背景：与黑色覆盖层按0.6/0.4混合等价于亮度乘以0.4，
+        # 只在面板区域内原地计算，不再复制整帧并对整帧混合
+        panel = frame_bgr[10:131, 10:301]
+        cv2.addWeighted(panel, 0.4, panel, 0, 0, dst=panel)
         
         # 绘制边框
         cv2.rectangle(frame_bgr, (10, 10), (300, 130), (100, 150, 200), 2)
         
         # 绘制文字
-        texts = [info_text, pos_text, theta_text, vel_text, ang_text]
         y_positions = [35, 55, 75, 95, 115]
         
         for text, y_pos in zip(texts, y_positions):
@@ -913,29 +1144,64 @@ class Renderer2Dto3D:
                        cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
         
         # 绘制指南针
-        self._draw_compass(frame_bgr, robot_pos['theta'])
+        self._draw_compass(frame_bgr, step_idx)
         
         # 转换回RGB
         frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
         
         return frame_rgb
     
-    def _draw_compass(self, frame, theta):
+    def _build_compass_shade(self):
+        """
+        预先计算指南针背景圆所在的矩形区域（裁剪到图像内）和区域内的圆形掩码
+        
+        Returns:
+            (ys, xs, mask): 区域的行/列切片和 (h, w, 1) 的布尔掩码
+        """
+        cx, cy, r = self._compass_x, self._compass_y, self._compass_radius
+        x0, y0 = max(cx - r, 0), max(cy - r, 0)
+        x1, y1 = min(cx + r + 1, self.image_width), min(cy + r + 1, self.image_height)
+        mask = np.zeros((max(y1 - y0, 0), max(x1 - x0, 0)), dtype=np.uint8)
+        cv2.circle(mask, (cx - x0, cy - y0), r, 255, -1)
+        return slice(y0, y1), slice(x0, x1), mask[..., None] > 0
+    
+    def _build_ui_texts(self):
+        """预先格式化每一帧的UI文本 [Frame, Pos, Theta, Linear, Angular]"""
+        actions = self.episode_data.get("actions", [])
+        theta_deg = np.rad2deg(self._traj_theta).tolist()
+        
+        ui_texts = []
+        for step_idx, (x, y, deg) in enumerate(zip(self._traj_x.tolist(), self._traj_y.tolist(), theta_deg)):
+            if step_idx < len(actions):
+                linear = actions[step_idx]['linear']
+                angular = actions[step_idx]['angular']
+            else:
+                linear = angular = 0.0
+            ui_texts.append([
+                f"Frame: {step_idx + 1}/{self._traj_len}",
+                f"Pos: ({x:.2f}, {y:.2f})",
+                f"Theta: {deg:.1f} deg",
+                f"Linear: {linear:.2f} m/s",
+                f"Angular: {angular:.2f} rad/s",
+            ])
+        
+        return ui_texts
+    
+    def _draw_compass(self, frame, step_idx):
         """绘制指南针"""
-        compass_x = self.image_width - 70
-        compass_y = 50
-        compass_radius = 30
-        
-        # 背景圆
-        overlay = frame.copy()
-        cv2.circle(overlay, (compass_x, compass_y), compass_radius, (0, 0, 0), -1)
-        cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
+        compass_x = self._compass_x
+        compass_y = self._compass_y
+        compass_radius = self._compass_radius
+        
+        # 背景圆（只在预先计算的圆形掩码内变暗，不复制整帧）
+        ys, xs, disc = self._compass_shade
+        roi = frame[ys, xs]
+        np.copyto(roi, cv2.addWeighted(roi, 0.4, roi, 0, 0), where=disc)
         cv2.circle(frame, (compass_x, compass_y), compass_radius, (100, 150, 200), 2)
         
-        # 方向箭头
-        arrow_length = compass_radius - 8
-        arrow_end_x = int(compass_x + arrow_length * np.cos(theta - np.pi/2))
-        arrow_end_y = int(compass_y + arrow_length * np.sin(theta - np.pi/2))
+        # 方向箭头（终点已在初始化时预计算）
+        arrow_end_x = int(self._arrow_end_x[step_idx])
+        arrow_end_y = int(self._arrow_end_y[step_idx])
         
         cv2.arrowedLine(frame, (compass_x, compass_y), (arrow_end_x, arrow_end_y),
                        (100, 255, 100), 3, tipLength=0.4)
@@ -954,16 +1220,11 @@ class Renderer2Dto3D:
     
     def _estimate_room_size(self) -> float:
         """估算房间大小"""
-        robot_traj = self.episode_data.get("robot_trajectory", [])
-        
-        if not robot_traj:
+        if self._traj_len == 0:
             return 10.0
         
-        x_coords = [pos["x"] for pos in robot_traj]
-        y_coords = [pos["y"] for pos in robot_traj]
-        
-        x_range = max(x_coords) - min(x_coords)
-        y_range = max(y_coords) - min(y_coords)
+        x_range = float(self._traj_x.max() - self._traj_x.min())
+        y_range = float(self._traj_y.max() - self._traj_y.min())
         
         room_size = max(x_range, y_range) * 1.2
         
@@ -982,7 +1243,6 @@ class Renderer2Dto3D:
         # 清理旧文件
         if clean_old_files and self.scene_dir.exists():
             print("\n[0/3] 清理旧文件...")
-            import shutil
             for pattern in ['*.mp4', '*.gif', 'frame_*.jpg']:
                 for file in self.scene_dir.glob(pattern):
                     try:
@@ -1047,8 +1307,13 @@ def main():
     
     # 读取episode数据
     print(f"读取数据: {args.input}")
-    with open(args.input, 'r', encoding='utf-8') as f:
-        episode_data = json.load(f)
+    if orjson is not None:
+        with open(args.input, 'rb') as f:
+            episode_data = orjson.loads(f.read())
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            episode_data = json.load(f)
+    _nulls_to_nan(episode_data)
     
     # 创建渲染器
     renderer = Renderer2Dto3D(
@@ -11,6 +11,12 @@ import json
 import os
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时回退到标准库json
+    orjson = None
+
 
 def main(
     env_file,
@@ -87,6 +93,18 @@ def main(
             neupan_planner.initial_path[j][-1, 0] = -1
             neupan_planner.initial_path[j][-2, 0] = neupan_planner.initial_path[j][-2, 0] + 3.14
     
+    # 预分配逐步记录用的数组，循环中只做数组赋值，结束后一次性转换为列表
+    # （使用float64，保证写入json的数值与逐步float()转换时完全一致）
+    num_obs = len(obstacle_info_list)
+    obs_vel_dims = [len(obs["velocity"]) for obs in episode_data["initial_obstacles"]]
+    state_arr = None   # (max_steps, state_dim)，首步时按状态维度分配
+    action_arr = None  # (max_steps, action_dim)
+    obs_xy_arr = np.zeros((max_steps, num_obs, 2))
+    obs_vel_arrs = [np.zeros((max_steps, dim)) for dim in obs_vel_dims]
+    stop_arr = np.zeros(max_steps, dtype=bool)
+    arrive_arr = np.zeros(max_steps, dtype=bool)
+    num_recorded = 0
+    
     # 主循环
     step = 0
     success = False
@@ -123,46 +141,26 @@ def main(
         if current_waypoint is None and hasattr(robot_info, 'goal'):
             current_waypoint = robot_info.goal[:2].flatten().tolist()
         
-        # 记录当前步的信息
-        step_data = {
-            "step": step + 1,
-            "robot_state": robot_state.flatten().tolist(),
-            "action": action.flatten().tolist(),
-            "waypoint": current_waypoint,
-            "neupan_info": {
-                "stop": bool(info["stop"]),
-                "arrive": bool(info["arrive"]),
-            }
-        }
-        
-        # 记录机器人轨迹
-        episode_data["robot_trajectory"].append({
-            "x": float(robot_state[0, 0]),
-            "y": float(robot_state[1, 0]),
-            "theta": float(robot_state[2, 0]),
-        })
-        
-        # 记录action
-        episode_data["actions"].append({
-            "linear": float(action[0, 0]) if action.shape[0] > 0 else 0.0,
-            "angular": float(action[1, 0]) if action.shape[0] > 1 else 0.0,
-        })
+        # 记录机器人状态和action
+        if state_arr is None:
+            state_arr = np.empty((max_steps, robot_state.shape[0]))
+            action_arr = np.empty((max_steps, action.shape[0]))
+        state_arr[i] = robot_state[:, 0]
+        action_arr[i] = action[:, 0]
+        stop_arr[i] = info["stop"]
+        arrive_arr[i] = info["arrive"]
         
         # 记录waypoint
         episode_data["waypoints"].append(current_waypoint)
         
         # 记录障碍物当前位置
         current_obstacle_info = env.get_obstacle_info_list()
-        for idx, obs_info in enumerate(current_obstacle_info):
-            if idx < len(episode_data["obstacle_trajectories"]):
-                episode_data["obstacle_trajectories"][idx].append({
-                    "x": float(obs_info.center[0, 0]),
-                    "y": float(obs_info.center[1, 0]),
-                    "velocity": obs_info.velocity.flatten().tolist() if obs_info.velocity is not None else [0.0, 0.0],
-                })
+        for idx, obs_info in enumerate(current_obstacle_info[:num_obs]):
+            obs_xy_arr[i, idx] = obs_info.center[:2, 0]
+            if obs_info.velocity is not None:
+                obs_vel_arrs[idx][i] = obs_info.velocity.ravel()
         
-        # 记录详细步骤信息
-        episode_data["step_info"].append(step_data)
+        num_recorded = i + 1
         
         # 检查是否到达或停止
         if info["stop"]:
@@ -189,36 +187,57 @@ def main(
         
         step += 1
     
-    # 根据轨迹数据标记动态障碍物
+    # 将记录的数组一次性转换为json所需的列表结构
+    states = state_arr[:num_recorded].tolist() if state_arr is not None else []
+    actions = action_arr[:num_recorded].tolist() if action_arr is not None else []
+    
+    for k, (state, act) in enumerate(zip(states, actions)):
+        episode_data["robot_trajectory"].append({
+            "x": state[0],
+            "y": state[1],
+            "theta": state[2],
+        })
+        episode_data["actions"].append({
+            "linear": act[0] if len(act) > 0 else 0.0,
+            "angular": act[1] if len(act) > 1 else 0.0,
+        })
+        episode_data["step_info"].append({
+            "step": k + 1,
+            "robot_state": state,
+            "action": act,
+            "waypoint": episode_data["waypoints"][k],
+            "neupan_info": {
+                "stop": bool(stop_arr[k]),
+                "arrive": bool(arrive_arr[k]),
+            }
+        })
+    
+    obs_xy = obs_xy_arr[:num_recorded].tolist()
+    for idx in range(num_obs):
+        obs_vel = obs_vel_arrs[idx][:num_recorded].tolist()
+        episode_data["obstacle_trajectories"][idx] = [
+            {"x": xy[idx][0], "y": xy[idx][1], "velocity": vel}
+            for xy, vel in zip(obs_xy, obs_vel)
+        ]
+    
+    # 根据轨迹数据标记动态障碍物（直接在数组上向量化计算）
     print("\n标记动态障碍物...")
     for obs_idx, obs_data in enumerate(episode_data["initial_obstacles"]):
         is_dynamic = False
         
-        # 检查轨迹中是否有速度变化或位置变化
-        if obs_idx in episode_data["obstacle_trajectories"]:
-            traj = episode_data["obstacle_trajectories"][obs_idx]
+        if num_recorded > 1:
+            # 方法1: 检查是否有非零速度
+            vel = obs_vel_arrs[obs_idx][:num_recorded, :2]
+            has_velocity = bool(np.any(np.abs(vel) > 1e-6))
             
-            if len(traj) > 1:
-                # 方法1: 检查是否有非零速度
-                has_velocity = False
-                for step_pos in traj:
-                    vel = step_pos.get('velocity', [0.0, 0.0])
-                    if abs(vel[0]) > 1e-6 or abs(vel[1]) > 1e-6:
-                        has_velocity = True
-                        break
-                
-                # 方法2: 检查位置是否有显著变化
-                start_pos = traj[0]
-                end_pos = traj[-1]
-                distance_moved = np.sqrt(
-                    (end_pos['x'] - start_pos['x'])**2 + 
-                    (end_pos['y'] - start_pos['y'])**2
-                )
-                
-                is_dynamic = has_velocity or distance_moved > 0.1
-                
-                if is_dynamic:
-                    print(f"  障碍物 {obs_idx}: 动态（移动距离 {distance_moved:.2f}m）")
+            # 方法2: 检查位置是否有显著变化
+            dx, dy = obs_xy_arr[num_recorded - 1, obs_idx] - obs_xy_arr[0, obs_idx]
+            distance_moved = float(np.hypot(dx, dy))
+            
+            is_dynamic = has_velocity or distance_moved > 0.1
+            
+            if is_dynamic:
+                print(f"  障碍物 {obs_idx}: 动态（移动距离 {distance_moved:.2f}m）")
         
         obs_data["is_dynamic"] = is_dynamic
     
@@ -241,8 +260,18 @@ def main(
     
     # 保存数据
     output_file = output_path / "episode_data.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(episode_data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        # orjson序列化速度远快于json.dump，输出为UTF-8编码。
+        # 与json.dump的输出并不完全相同：NaN/Inf写为null（json.dump写为NaN），浮点数的格式也可能不同；
+        # 读取端（visualize_episode_data.py、render2Dto3D_pyrender.py）把null数值视为缺失值（NaN）
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(
+                episode_data,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            ))
+    else:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(episode_data, f, indent=2, ensure_ascii=False)
     
     print(f"\n数据已保存到: {output_file}")
     print(f"总步数: {step}")
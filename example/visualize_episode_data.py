@@ -3,20 +3,253 @@
 用于验证run_exp_for_render.py的输出是否正确
 """
 
+import itertools
 import json
+import math
+import multiprocessing as mp
+import os
+import shutil
+import subprocess
+from array import array
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-from matplotlib.animation import FuncAnimation, PillowWriter
+from matplotlib.animation import FuncAnimation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import EllipseCollection, LineCollection, PatchCollection, PolyCollection
 import argparse
 from pathlib import Path
 from tqdm import tqdm
+from PIL import Image
+
+try:
+    import ijson
+except ImportError:
+    # 未安装ijson时回退到json.load一次性加载
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    # 未安装orjson时回退到标准库json
+    orjson = None
+
+try:
+    import imageio.v2 as imageio
+except ImportError:
+    # 未安装imageio时，mp4直接通过管道写入ffmpeg子进程
+    imageio = None
+
+
+# 按列加载为numpy数组的逐步记录字段：顶层键 -> 每一项中需要的子字段
+EPISODE_COLUMNS = {
+    'robot_trajectory': ('x', 'y', 'theta'),
+    'actions': ('linear', 'angular'),
+}
+
+# 可视化用不到的大字段，流式解析时直接跳过
+EPISODE_SKIPPED_KEYS = ('step_info',)
+
+# 安装了orjson时，小于该大小的文件直接一次性解析（比ijson逐事件解析快得多），更大的文件才流式解析
+EPISODE_STREAM_MIN_BYTES = 64 * 1024 * 1024
+
+
+def _read_json(path):
+    """一次性读取并解析JSON文件，优先使用orjson"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # orjson不接受NaN/Infinity等非标准字面量（json.dump默认会写出），交给标准库解析
+            return json.loads(raw)
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_episode_data(episode_data_path):
+    """
+    加载episode_data.json，逐步记录的字段直接按列转换为numpy数组
+    
+    安装了ijson时流式解析：EPISODE_COLUMNS中的数值和障碍物轨迹坐标边解析边写入紧凑的数组，
+    不构造中间的字典列表，EPISODE_SKIPPED_KEYS中的字段直接跳过，峰值内存远低于json.load。
+    安装了orjson且文件小于EPISODE_STREAM_MIN_BYTES时，一次性解析更快，不走流式解析。
+    
+    Args:
+        episode_data_path: episode_data.json文件路径
+    
+    Returns:
+        data: 其余顶层字段组成的字典
+        columns: {顶层键: {子字段: 一维float64数组}}
+        obstacle_xy: {障碍物id(int): 轨迹坐标数组 (T, 2)}
+    """
+    if ijson is None or (orjson is not None
+                         and os.path.getsize(episode_data_path) < EPISODE_STREAM_MIN_BYTES):
+        data = _read_json(episode_data_path)
+        for key in EPISODE_SKIPPED_KEYS:
+            data.pop(key, None)
+        
+        columns = {}
+        for key, fields in EPISODE_COLUMNS.items():
+            items = data.pop(key, [])
+            # np.array把null（None）转换为NaN，与流式解析时一样视为缺失值
+            columns[key] = {
+                field: np.array([item[field] for item in items], dtype=np.float64)
+                for field in fields
+            }
+        
+        obstacle_xy = {
+            int(obs_id): np.array([(pos['x'], pos['y']) for pos in traj], dtype=np.float64).reshape(-1, 2)
+            for obs_id, traj in data.pop('obstacle_trajectories', {}).items()
+        }
+        return data, columns, obstacle_xy
+    
+    buffers = {key: {field: array('d') for field in fields} for key, fields in EPISODE_COLUMNS.items()}
+    # 逐项数值的事件前缀，如 'robot_trajectory.item.x' -> 对应的缓冲区
+    column_prefixes = {
+        f"{key}.item.{field}": buf
+        for key, fields in buffers.items() for field, buf in fields.items()
+    }
+    
+    # 障碍物轨迹：{id字符串: {'x': 缓冲区, 'y': 缓冲区}}
+    obstacle_buffers = {}
+    
+    data = {}
+    current_key = None
+    builder = None
+    with open(episode_data_path, 'rb') as f:
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if prefix == '':
+                # 顶层字典：遇到新键或结束时收尾上一个字段
+                if builder is not None:
+                    data[current_key] = builder.value
+                    builder = None
+                if event == 'map_key':
+                    current_key = value
+                    if (current_key not in EPISODE_COLUMNS and current_key not in EPISODE_SKIPPED_KEYS
+                            and current_key != 'obstacle_trajectories'):
+                        builder = ijson.ObjectBuilder()
+                continue
+            
+            if builder is not None:
+                builder.event(event, value)
+            elif current_key == 'obstacle_trajectories':
+                if event == 'map_key' and prefix == 'obstacle_trajectories':
+                    obstacle_buffers[value] = {'x': array('d'), 'y': array('d')}
+                elif event in ('number', 'null'):
+                    # 'obstacle_trajectories.<id>.item.x'（跳过velocity等其他字段）
+                    parts = prefix.split('.')
+                    if len(parts) == 4 and parts[3] in ('x', 'y'):
+                        obstacle_buffers[parts[1]][parts[3]].append(math.nan if value is None else value)
+            elif event in ('number', 'null'):
+                buf = column_prefixes.get(prefix)
+                if buf is not None:
+                    buf.append(math.nan if value is None else value)
+    
+    columns = {
+        key: {field: np.frombuffer(buf, dtype=np.float64) for field, buf in fields.items()}
+        for key, fields in buffers.items()
+    }
+    obstacle_xy = {
+        int(obs_id): np.column_stack([np.frombuffer(xy['x'], dtype=np.float64),
+                                      np.frombuffer(xy['y'], dtype=np.float64)])
+        for obs_id, xy in obstacle_buffers.items()
+    }
+    return data, columns, obstacle_xy
+
+
+def _write_mp4_ffmpeg(output_path, frames, fps, bitrate='1800k'):
+    """
+    把RGB或RGBA帧通过管道直接写入ffmpeg子进程编码为mp4（未安装imageio时使用）
+    
+    ffmpeg路径取matplotlib的animation.ffmpeg_path配置，与原先的FFMpegWriter一致。
+    RGBA帧（画布缓冲区）按rgba像素格式原样写入，无需先去掉alpha通道再整理为连续数组。
+    
+    Args:
+        output_path: 输出mp4路径
+        frames: RGB（H, W, 3）或RGBA（H, W, 4）帧的可迭代对象，尺寸和像素格式由第一帧确定
+        fps: 帧率
+        bitrate: 视频码率
+    """
+    ffmpeg_bin = shutil.which(matplotlib.rcParams['animation.ffmpeg_path'])
+    if ffmpeg_bin is None:
+        raise RuntimeError("未找到ffmpeg")
+    
+    frames = iter(frames)
+    first = next(frames)
+    height, width, depth = first.shape
+    cmd = [
+        ffmpeg_bin, '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgba' if depth == 4 else 'rgb24',
+        '-s', f'{width}x{height}', '-r', str(fps),
+        '-i', '-',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-b:v', bitrate,
+        str(output_path),
+    ]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20)
+    try:
+        for image in itertools.chain([first], frames):
+            # 连续的帧（画布RGBA缓冲区、并行渲染返回的RGB数组）不会复制，直接通过memoryview写入管道
+            proc.stdin.write(memoryview(np.ascontiguousarray(image)).cast('B'))
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg已提前退出，缓冲区中剩余的数据无法写入，失败原因见下面的退出码和错误信息
+            pass
+        err = proc.stderr.read()
+        proc.wait()
+    
+    if proc.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg编码失败（退出码 {proc.returncode}）: {err.decode(errors='ignore').strip()}"
+        )
+
+
+# 并行渲染时每个工作进程持有的可视化器（由进程池initializer创建）
+_worker_visualizer = None
+
+
+def _init_frame_worker(visualizer, dpi):
+    """
+    进程池初始化：在工作进程中为可视化器创建独立的Agg画布并绘制静态场景
+    
+    Args:
+        visualizer: 可视化器（只序列化数据，不含matplotlib对象）
+        dpi: 输出分辨率
+    """
+    global _worker_visualizer
+    fig = plt.Figure(figsize=(12, 10), dpi=dpi)
+    FigureCanvasAgg(fig)
+    visualizer.fig, visualizer.ax = fig, fig.add_subplot()
+    visualizer.init_animation()
+    _worker_visualizer = visualizer
+
+
+def _render_frame_worker(frame):
+    """在工作进程中渲染一帧，返回RGB数组"""
+    visualizer = _worker_visualizer
+    visualizer.update_animation(frame)
+    visualizer.fig.canvas.draw()
+    return np.asarray(visualizer.fig.canvas.buffer_rgba())[..., :3].copy()
 
 
 class EpisodeVisualizer:
     """从episode_data.json可视化2D导航过程"""
     
-    def __init__(self, episode_data_path, output_path=None, fps=10):
+    # matplotlib对象，序列化（并行渲染传给工作进程）时不包含
+    _FIGURE_ATTRS = (
+        'fig', 'ax', 'robot_patch', 'robot_direction_line', 'robot_trail_line',
+        'info_text', 'waypoint_marker', 'dynamic_obstacle_collection', 'dynamic_circle_collection',
+    )
+    
+    def __init__(self, episode_data_path, output_path=None, fps=10, workers=1, max_frames=None,
+                 subsample=1, max_size=None):
         """
         初始化可视化器
         
@@ -24,173 +257,393 @@ class EpisodeVisualizer:
             episode_data_path: episode_data.json文件路径
             output_path: 输出gif/mp4文件路径（可选）
             fps: 动画帧率
+            workers: 保存动画时并行渲染的进程数（1为单进程）
+            max_frames: 动画最多渲染的帧数（可选，至少为1），轨迹更长时均匀抽取轨迹点
+            subsample: 每隔多少个轨迹点渲染一帧（1为每个轨迹点都渲染）
+            max_size: 保存的动画长边最多的像素数（可选），超过时降低dpi
         """
+        if max_frames is not None and max_frames < 1:
+            raise ValueError(f"max_frames必须大于等于1，当前为 {max_frames}")
+        
         self.fps = fps
         self.output_path = output_path
+        self.workers = workers
+        self.max_frames = max_frames
+        self.subsample = max(1, subsample)
+        self.max_size = max_size
         
-        # 加载数据
+        # 加载数据（机器人轨迹和动作直接按列加载为numpy数组，逐帧只做数组索引/切片；
+        # 障碍物轨迹加载为 {id: (T, 2)坐标数组}，逐帧只做整数索引）
         print(f"加载数据: {episode_data_path}")
-        with open(episode_data_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+        self.data, columns, self._obs_xy = load_episode_data(episode_data_path)
         
         # 提取数据
         self.robot_info = self.data['robot_info']
-        self.robot_trajectory = self.data['robot_trajectory']
         self.initial_obstacles = self.data['initial_obstacles']
-        self.obstacle_trajectories = self.data.get('obstacle_trajectories', {})
-        self.actions = self.data.get('actions', [])
         self.waypoints = self.data.get('waypoints', [])
         self.metadata = self.data.get('metadata', {})
         
-        print(f"机器人轨迹点数: {len(self.robot_trajectory)}")
+        # 多边形障碍物的顶点只转换一次：_vertices_np为 (2, V)，_polygon_points为 (V, 2)
+        for obs in self.initial_obstacles:
+            if obs.get('vertices'):
+                vertices = np.asarray(obs['vertices'], dtype=np.float64)
+                if vertices.ndim == 2 and vertices.shape[0] == 2:
+                    obs['_vertices_np'] = vertices
+                    obs['_polygon_points'] = np.ascontiguousarray(vertices.T)
+        
+        # 所有障碍物的初始中心合并为一个 (M, 2) 数组，按障碍物下标索引
+        self._obstacle_centers = np.array(
+            [obs['initial_center'][:2] for obs in self.initial_obstacles], dtype=np.float64).reshape(-1, 2)
+        
+        trajectory = columns['robot_trajectory']
+        self._traj_x = trajectory['x']
+        self._traj_y = trajectory['y']
+        self._traj_theta = trajectory['theta']
+        self.num_steps = len(self._traj_x)
+        self._action_lin = columns['actions']['linear']
+        self._action_ang = columns['actions']['angular']
+        
+        # 方向指示线（起点为机器人中心）对整条轨迹一次性向量化计算为 (T, 2) 的x/y数组，
+        # 逐帧直接把该行（数组视图）交给set_data，无需逐帧计算三角函数或构造列表
+        radius = self.robot_info.get('radius', 0.5)
+        self._heading_xs = np.column_stack([self._traj_x, self._traj_x + radius * np.cos(self._traj_theta)])
+        self._heading_ys = np.column_stack([self._traj_y, self._traj_y + radius * np.sin(self._traj_theta)])
+        
+        # 场景范围与帧无关，只计算一次
+        self._xlim, self._ylim = self._compute_bounds()
+        
+        # 区分静态/动态障碍物，并把静态障碍物的几何数据整理成Collection可直接使用的数组
+        self._obstacle_is_dynamic = self._detect_dynamic_obstacles()
+        self._build_static_scene()
+        
+        # waypoint转换为 (T, 2) 数组，缺失或格式不对的waypoint为NaN（matplotlib不绘制NaN点），
+        # 逐帧直接按帧索引，无需逐帧判断类型
+        self._waypoint_xy = np.full((max(len(self.waypoints), self.num_steps), 2), np.nan)
+        for i, waypoint in enumerate(self.waypoints):
+            if isinstance(waypoint, (list, tuple)) and len(waypoint) >= 2:
+                self._waypoint_xy[i] = waypoint[:2]
+        
+        # 所有帧的信息文本在初始化时一次性格式化，逐帧直接按帧索引
+        self._info_texts = self._build_info_texts()
+        
+        print(f"机器人轨迹点数: {self.num_steps}")
         print(f"障碍物数量: {len(self.initial_obstacles)}")
-        print(f"总步数: {self.metadata.get('total_step', len(self.robot_trajectory))}")
+        print(f"总步数: {self.metadata.get('total_step', self.num_steps)}")
         print(f"任务状态: {self.metadata.get('status', 'Unknown')}")
         
-        # 用于动画的对象引用
+        # 用于动画的对象引用（动画导出后figure保留给静态图复用）
+        self.fig = None
+        self.ax = None
         self.robot_patch = None
         self.robot_direction_line = None
         self.robot_trail_line = None
         self.info_text = None
         self.waypoint_marker = None
-        self.dynamic_obstacle_patches = []  # 存储动态障碍物的patch对象
-        self.static_obstacle_patches = []   # 存储静态障碍物的patch对象
+        self.dynamic_obstacle_collection = None  # 所有动态多边形障碍物合并成的一个PolyCollection（逐帧更新顶点）
+        self.dynamic_circle_collection = None    # 所有动态圆形障碍物合并成的一个EllipseCollection（逐帧更新中心）
+        self.dynamic_obstacles = []  # 动态多边形障碍物：id、初始位置下的路径顶点/指令和逐帧顶点数组
+        
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(dict.fromkeys(self._FIGURE_ATTRS))
+        # 原始数据中的大字段在初始化后已不再使用
+        state['data'] = None
+        return state
+    
+    def _frame_indices(self):
+        """
+        动画各帧对应的轨迹索引：先每隔subsample个轨迹点取一帧，
+        帧数仍超过max_frames时再用np.linspace均匀抽取
+        """
+        frames = np.arange(0, self.num_steps, self.subsample)
+        if self.max_frames and len(frames) > self.max_frames:
+            frames = frames[np.linspace(0, len(frames) - 1, self.max_frames).astype(np.int64)]
+        return frames
+    
+    def _export_dpi(self, default_dpi=80):
+        """
+        保存动画使用的dpi：指定了max_size时，降低dpi使图像长边不超过max_size像素
+        
+        dpi取整数，12x10英寸画布的宽高因此都是偶数（libx264的yuv420p要求）。
+        """
+        if not self.max_size:
+            return default_dpi
+        return max(1, min(default_dpi, int(self.max_size // max(self.fig.get_size_inches()))))
+    
+    def _build_info_texts(self):
+        """预先格式化每一帧的信息文本（步数和动作）"""
+        linear = self._action_lin.tolist()
+        angular = self._action_ang.tolist()
+        
+        texts = []
+        for i in range(self.num_steps):
+            text = f"Step: {i + 1}/{self.num_steps}\n"
+            if i < len(linear):
+                text += f"Linear: {linear[i]:.3f} m/s\n"
+                text += f"Angular: {angular[i]:.3f} rad/s"
+            texts.append(text)
+        return texts
+    
+    def _scene_points(self):
+        """
+        把机器人轨迹、障碍物中心和多边形顶点汇总为一个连续的 (K, 2) 坐标数组
+        """
+        points = [np.column_stack([self._traj_x, self._traj_y]), self._obstacle_centers]
         
-    def setup_figure(self):
-        """设置图形窗口"""
-        # 计算场景范围
-        all_x = [pos['x'] for pos in self.robot_trajectory]
-        all_y = [pos['y'] for pos in self.robot_trajectory]
+        # 如果有顶点，也加入范围计算
+        points.extend(obs['_polygon_points'] for obs in self.initial_obstacles if '_polygon_points' in obs)
         
-        # 添加障碍物位置
-        for obs in self.initial_obstacles:
-            center = obs['initial_center']
-            all_x.append(center[0])
-            all_y.append(center[1])
-            
-            # 如果有顶点，也加入范围计算
-            if 'vertices' in obs and obs['vertices']:
-                vertices = np.array(obs['vertices'])
-                if vertices.ndim == 2 and vertices.shape[0] == 2:
-                    all_x.extend(vertices[0, :].tolist())
-                    all_y.extend(vertices[1, :].tolist())
+        return np.concatenate(points)
+    
+    def _compute_bounds(self, margin=5.0):
+        """
+        计算场景范围（机器人轨迹、障碍物中心和多边形顶点），各留出margin的边距
         
-        # 设置坐标轴范围
-        margin = 5.0
-        x_min, x_max = min(all_x) - margin, max(all_x) + margin
-        y_min, y_max = min(all_y) - margin, max(all_y) + margin
+        Returns:
+            (x_min, x_max), (y_min, y_max)
+        """
+        points = self._scene_points()
+        (x_min, y_min), (x_max, y_max) = points.min(axis=0), points.max(axis=0)
+        
+        return ((float(x_min) - margin, float(x_max) + margin),
+                (float(y_min) - margin, float(y_max) + margin))
+    
+    def _apply_axes(self, ax, title_prefix):
+        """
+        设置坐标轴范围（预先计算好的场景范围）、网格、标签和标题
         
-        self.ax.set_xlim(x_min, x_max)
-        self.ax.set_ylim(y_min, y_max)
-        self.ax.set_aspect('equal')
-        self.ax.grid(True, alpha=0.3)
-        self.ax.set_xlabel('X (m)', fontsize=12)
-        self.ax.set_ylabel('Y (m)', fontsize=12)
+        Args:
+            ax: 要设置的坐标轴
+            title_prefix: 标题前缀（后接任务状态）
+        """
+        ax.set_xlim(*self._xlim)
+        ax.set_ylim(*self._ylim)
+        ax.set_aspect('equal')
+        ax.grid(True, alpha=0.3)
+        ax.set_xlabel('X (m)', fontsize=12)
+        ax.set_ylabel('Y (m)', fontsize=12)
         
         # 标题
-        title = f"Episode Visualization - {self.metadata.get('status', 'Unknown')}"
+        title = f"{title_prefix} - {self.metadata.get('status', 'Unknown')}"
         if self.metadata.get('success', 0) > 0.5:
             title += " ✓"
-        self.ax.set_title(title, fontsize=14, fontweight='bold')
+        ax.set_title(title, fontsize=14, fontweight='bold')
+    
+    def _detect_dynamic_obstacles(self):
+        """
+        判断每个障碍物是否是动态的：有明确标记，或轨迹数据显示其移动超过0.1米
+        
+        所有障碍物轨迹的起点/终点堆叠为数组，用一次np.hypot算出移动距离。
         
+        Returns:
+            与initial_obstacles一一对应的布尔数组
+        """
+        # 检查是否真的是动态障碍物（通过轨迹数据判断）
+        is_dynamic = np.array([bool(obs.get('is_dynamic', False)) for obs in self.initial_obstacles],
+                              dtype=bool)
+        
+        # 如果没有明确标记，通过轨迹数据自动判断
+        candidates = []
+        for i, obs in enumerate(self.initial_obstacles):
+            obs_xy = self._obs_xy.get(obs['id'])
+            if not is_dynamic[i] and obs_xy is not None and len(obs_xy) > 1:
+                candidates.append((i, obs_xy))
+        if not candidates:
+            return is_dynamic
+        
+        # 检查起始和结束位置是否有显著变化
+        indices = np.array([i for i, _ in candidates])
+        starts = np.array([obs_xy[0] for _, obs_xy in candidates])
+        ends = np.array([obs_xy[-1] for _, obs_xy in candidates])
+        distances_moved = np.hypot(*(ends - starts).T)
+        
+        # 如果移动距离超过0.1米，认为是动态障碍物
+        moved = distances_moved > 0.1
+        is_dynamic[indices[moved]] = True
+        for i, distance_moved in zip(indices[moved], distances_moved[moved]):
+            print(f"检测到障碍物 {self.initial_obstacles[i]['id']} 是动态的（移动了 {distance_moved:.2f}m）")
+        
+        return is_dynamic
+    
+    def _build_static_scene(self):
+        """
+        整理静态障碍物的几何数据：多边形为 (V, 2) 顶点数组列表，圆形为中心 (M, 2) 和半径 (M,) 数组
+        """
+        self._static_poly_verts = []
+        circle_indices = []
+        radii = []
+        for i, (obs, is_dynamic) in enumerate(zip(self.initial_obstacles, self._obstacle_is_dynamic)):
+            if is_dynamic:
+                continue
+            if 'vertices' in obs and obs['vertices']:
+                if '_polygon_points' in obs:
+                    self._static_poly_verts.append(obs['_polygon_points'])
+            else:
+                circle_indices.append(i)
+                radii.append(obs.get('radius', 0.5))
+        
+        self._static_circle_centers = self._obstacle_centers[circle_indices]
+        self._static_circle_radii = np.asarray(radii, dtype=np.float64)
+    
+    def _draw_static_scene(self, ax, label=None, zorder=1):
+        """
+        绘制静态障碍物（红色）：多边形合并为一个PolyCollection，圆形合并为一个EllipseCollection，
+        动画和静态图共用
+        
+        Args:
+            ax: 要绘制的坐标轴
+            label: 图例标签（只加在第一个Collection上）
+            zorder: 绘制层级
+        """
+        style = dict(facecolors='red', alpha=0.3, edgecolors='darkred', linewidths=2, zorder=zorder)
+        
+        if self._static_poly_verts:
+            ax.add_collection(PolyCollection(self._static_poly_verts, label=label, **style),
+                              autolim=False)
+            label = None
+        
+        if len(self._static_circle_radii):
+            diameters = 2 * self._static_circle_radii
+            ax.add_collection(EllipseCollection(
+                diameters, diameters, 0, units='xy',
+                offsets=self._static_circle_centers, offset_transform=ax.transData,
+                label=label, **style), autolim=False)
+    
     def draw_obstacles(self):
-        """绘制障碍物（静态障碍物只绘制一次，动态障碍物创建可更新的patch）"""
-        self.dynamic_obstacle_patches = []
-        self.static_obstacle_patches = []
+        """
+        绘制障碍物
         
-        for obs in self.initial_obstacles:
-            center_x, center_y = obs['initial_center']
-            # 检查是否真的是动态障碍物（通过轨迹数据判断）
-            is_dynamic = obs.get('is_dynamic', False)
+        静态障碍物按形状合并为Collection，只绘制一次。动态多边形障碍物合并为一个PolyCollection，
+        所有帧的顶点预先计算为 (T, V, 2) 数组；动态圆形障碍物合并为一个EllipseCollection，
+        所有帧的中心预先整理为 (T, K, 2) 数组。逐帧只按帧号取出，不再每个障碍物一个Patch。
+        """
+        self._draw_static_scene(self.ax, zorder=5)
+        
+        self.dynamic_obstacles = []
+        circle_indices = []
+        circle_xy = []
+        circle_radii = []
+        for i, (obs, is_dynamic) in enumerate(zip(self.initial_obstacles, self._obstacle_is_dynamic)):
+            if not is_dynamic:
+                continue
             
-            # 如果没有明确标记，通过轨迹数据自动判断
-            if not is_dynamic and str(obs['id']) in self.obstacle_trajectories:
-                obs_traj = self.obstacle_trajectories[str(obs['id'])]
-                if len(obs_traj) > 1:
-                    # 检查起始和结束位置是否有显著变化
-                    start_pos = obs_traj[0]
-                    end_pos = obs_traj[-1]
-                    distance_moved = np.sqrt(
-                        (end_pos['x'] - start_pos['x'])**2 + 
-                        (end_pos['y'] - start_pos['y'])**2
-                    )
-                    # 如果移动距离超过0.1米，认为是动态障碍物
-                    if distance_moved > 0.1:
-                        is_dynamic = True
-                        print(f"检测到障碍物 {obs['id']} 是动态的（移动了 {distance_moved:.2f}m）")
+            obs_xy = self._obs_xy.get(obs['id'])
+            if obs_xy is None or len(obs_xy) == 0:
+                # 没有轨迹数据时停留在初始位置
+                obs_xy = self._obstacle_centers[i:i + 1]
             
-            # 如果有顶点，绘制多边形
-            if 'vertices' in obs and obs['vertices']:
-                vertices = np.array(obs['vertices'])
-                if vertices.ndim == 2 and vertices.shape[0] == 2:
-                    polygon_points = list(zip(vertices[0, :], vertices[1, :]))
-                    
-                    if is_dynamic:
-                        # 动态障碍物使用橙色
-                        polygon = patches.Polygon(polygon_points, 
-                                                 facecolor='orange', alpha=0.5, 
-                                                 edgecolor='darkorange', linewidth=2,
-                                                 zorder=5)
-                        self.ax.add_patch(polygon)
-                        self.dynamic_obstacle_patches.append({
-                            'patch': polygon,
-                            'obs_id': obs['id'],
-                            'type': 'polygon',
-                            'initial_vertices': vertices
-                        })
-                    else:
-                        # 静态障碍物使用红色
-                        polygon = patches.Polygon(polygon_points, 
-                                                 facecolor='red', alpha=0.3, 
-                                                 edgecolor='darkred', linewidth=2,
-                                                 zorder=5)
-                        self.ax.add_patch(polygon)
-                        self.static_obstacle_patches.append(polygon)
+            if not ('vertices' in obs and obs['vertices']):
+                # 圆形障碍物只需要逐帧中心
+                circle_indices.append(i)
+                circle_xy.append(obs_xy)
+                circle_radii.append(obs.get('radius', 0.5))
+                continue
+            
+            patch = self._make_obstacle_patch(obs)
+            if patch is None:
+                continue
+            
+            # 多边形障碍物按轨迹相对初始中心的位移一次性平移出每一帧的顶点 (T, V, 2)
+            path = patch.get_path()
+            offsets = obs_xy - self._obstacle_centers[i]
+            self.dynamic_obstacles.append({
+                'obs_id': obs['id'],
+                'vertices': path.vertices,
+                'codes': path.codes,
+                'frame_verts': path.vertices[None, :, :] + offsets[:, None, :],
+            })
+        self._dynamic_codes = [dyn_obs['codes'] for dyn_obs in self.dynamic_obstacles]
+        
+        # 圆形障碍物的轨迹补齐到相同帧数（较短的轨迹用最后的位置填充），堆叠为 (T, K, 2)
+        self._dynamic_circle_initial = self._obstacle_centers[circle_indices]
+        self._dynamic_circle_centers = None
+        if circle_xy:
+            num_frames = max(len(xy) for xy in circle_xy)
+            self._dynamic_circle_centers = np.stack(
+                [np.pad(xy, ((0, num_frames - len(xy)), (0, 0)), mode='edge') for xy in circle_xy], axis=1)
+        
+        # 动态障碍物使用橙色
+        style = dict(facecolors='orange', alpha=0.5, edgecolors='darkorange', linewidths=2, zorder=5)
+        
+        self.dynamic_obstacle_collection = None
+        if self.dynamic_obstacles:
+            self.dynamic_obstacle_collection = PolyCollection([], **style)
+            self.ax.add_collection(self.dynamic_obstacle_collection, autolim=False)
+        
+        self.dynamic_circle_collection = None
+        if circle_radii:
+            diameters = 2 * np.asarray(circle_radii, dtype=np.float64)
+            self.dynamic_circle_collection = EllipseCollection(
+                diameters, diameters, 0, units='xy',
+                offsets=self._dynamic_circle_initial, offset_transform=self.ax.transData, **style)
+            self.ax.add_collection(self.dynamic_circle_collection, autolim=False)
+        
+        self._update_dynamic_obstacles()
+    
+    def _make_obstacle_patch(self, obs, center=None):
+        """
+        为障碍物创建不带样式的Patch（有顶点时为多边形，否则为圆形），用于合并到Collection中
+        
+        Args:
+            obs: 障碍物数据
+            center: 圆形障碍物的中心（默认为初始中心）
+        """
+        if 'vertices' in obs and obs['vertices']:
+            if '_polygon_points' in obs:
+                return patches.Polygon(obs['_polygon_points'])
+            return None
+        
+        # 绘制圆形障碍物
+        if center is None:
+            center = obs['initial_center']
+        return patches.Circle((center[0], center[1]), obs.get('radius', 0.5))
+    
+    def _update_dynamic_obstacles(self, frame=None):
+        """
+        把所有动态障碍物在某一帧的位置更新到对应的Collection
+        
+        Args:
+            frame: 帧号（轨迹结束后保持最后的位置）；为None时使用初始位置
+        """
+        if self.dynamic_obstacle_collection is not None:
+            if frame is None:
+                verts = [dyn_obs['vertices'] for dyn_obs in self.dynamic_obstacles]
             else:
-                # 绘制圆形障碍物
-                radius = obs.get('radius', 0.5)
-                
-                if is_dynamic:
-                    # 动态障碍物使用橙色
-                    circle = patches.Circle((center_x, center_y), radius,
-                                           facecolor='orange', alpha=0.5,
-                                           edgecolor='darkorange', linewidth=2,
-                                           zorder=5)
-                    self.ax.add_patch(circle)
-                    self.dynamic_obstacle_patches.append({
-                        'patch': circle,
-                        'obs_id': obs['id'],
-                        'type': 'circle',
-                        'radius': radius
-                    })
-                else:
-                    # 静态障碍物使用红色
-                    circle = patches.Circle((center_x, center_y), radius,
-                                           facecolor='red', alpha=0.3,
-                                           edgecolor='darkred', linewidth=2,
-                                           zorder=5)
-                    self.ax.add_patch(circle)
-                    self.static_obstacle_patches.append(circle)
+                verts = [dyn_obs['frame_verts'][min(frame, len(dyn_obs['frame_verts']) - 1)]
+                         for dyn_obs in self.dynamic_obstacles]
+            self.dynamic_obstacle_collection.set_verts_and_codes(verts, self._dynamic_codes)
+        
+        if self.dynamic_circle_collection is not None:
+            if frame is None:
+                centers = self._dynamic_circle_initial
+            else:
+                centers = self._dynamic_circle_centers[min(frame, len(self._dynamic_circle_centers) - 1)]
+            self.dynamic_circle_collection.set_offsets(centers)
+    
+    def _animated_artists(self):
+        """返回逐帧更新的artist（用于blit）"""
+        artists = [self.robot_patch, self.robot_direction_line, self.robot_trail_line,
+                   self.info_text, self.waypoint_marker]
+        for collection in (self.dynamic_obstacle_collection, self.dynamic_circle_collection):
+            if collection is not None:
+                artists.append(collection)
+        return artists
     
     def init_animation(self):
         """初始化动画（只调用一次）"""
         self.ax.clear()
-        self.setup_figure()
+        self._apply_axes(self.ax, "Episode Visualization")
         
         # 绘制完整轨迹（淡色）
-        trajectory_x = [pos['x'] for pos in self.robot_trajectory]
-        trajectory_y = [pos['y'] for pos in self.robot_trajectory]
-        self.ax.plot(trajectory_x, trajectory_y, 'b--', 
+        self.ax.plot(self._traj_x, self._traj_y, 'b--', 
                     alpha=0.3, linewidth=1, label='Planned Path', zorder=3)
         
         # 绘制起点和终点
-        if len(self.robot_trajectory) > 0:
-            start_pos = self.robot_trajectory[0]
-            self.ax.plot(start_pos['x'], start_pos['y'], 
+        if self.num_steps > 0:
+            self.ax.plot(self._traj_x[0], self._traj_y[0], 
                         'go', markersize=15, label='Start', zorder=15)
             
-            end_pos = self.robot_trajectory[-1]
-            self.ax.plot(end_pos['x'], end_pos['y'], 
+            self.ax.plot(self._traj_x[-1], self._traj_y[-1], 
                         'r*', markersize=20, label='End', zorder=15)
         
         # 绘制静态障碍物
@@ -200,16 +653,13 @@ class EpisodeVisualizer:
         
         # 创建机器人patch（初始位置）
         radius = self.robot_info.get('radius', 0.5)
-        pos = self.robot_trajectory[0]
-        self.robot_patch = patches.Circle((pos['x'], pos['y']), radius,
+        x, y = self._traj_x[0], self._traj_y[0]
+        self.robot_patch = patches.Circle((x, y), radius,
                                          facecolor='blue', alpha=1.0, zorder=10)
         self.ax.add_patch(self.robot_patch)
         
         # 创建方向指示线
-        dx = radius * np.cos(pos['theta'])
-        dy = radius * np.sin(pos['theta'])
-        self.robot_direction_line, = self.ax.plot([pos['x'], pos['x'] + dx], 
-                                                   [pos['y'], pos['y'] + dy],
+        self.robot_direction_line, = self.ax.plot(self._heading_xs[0], self._heading_ys[0],
                                                    'r-', linewidth=2, zorder=11)
         
         # 创建机器人轨迹线（动态更新）
@@ -226,94 +676,37 @@ class EpisodeVisualizer:
         # 创建waypoint标记（初始不可见）
         self.waypoint_marker, = self.ax.plot([], [], 'g^', markersize=10, alpha=0.6, zorder=12)
         
-        # 返回所有需要更新的对象
-        artists = [self.robot_patch, self.robot_direction_line, self.robot_trail_line, 
-                   self.info_text, self.waypoint_marker]
-        
-        # 添加动态障碍物patches
-        for dyn_obs in self.dynamic_obstacle_patches:
-            artists.append(dyn_obs['patch'])
-        
-        return artists
+        # 返回所有需要更新的对象（包括动态障碍物）
+        return self._animated_artists()
     
     def update_animation(self, frame):
         """更新动画帧（高效版本，只更新变化的部分，包括动态障碍物）"""
-        if frame >= len(self.robot_trajectory):
-            artists = [self.robot_patch, self.robot_direction_line, self.robot_trail_line,
-                       self.info_text, self.waypoint_marker]
-            for dyn_obs in self.dynamic_obstacle_patches:
-                artists.append(dyn_obs['patch'])
-            return artists
-        
-        pos = self.robot_trajectory[frame]
-        radius = self.robot_info.get('radius', 0.5)
+        if frame >= self.num_steps:
+            return self._animated_artists()
+        
+        x, y = self._traj_x[frame], self._traj_y[frame]
         
         # 更新机器人位置
-        self.robot_patch.center = (pos['x'], pos['y'])
+        self.robot_patch.center = (x, y)
         
         # 更新方向指示线
-        dx = radius * np.cos(pos['theta'])
-        dy = radius * np.sin(pos['theta'])
-        self.robot_direction_line.set_data([pos['x'], pos['x'] + dx],
-                                           [pos['y'], pos['y'] + dy])
-        
-        # 更新已走过的轨迹
-        trajectory_x = [self.robot_trajectory[i]['x'] for i in range(frame + 1)]
-        trajectory_y = [self.robot_trajectory[i]['y'] for i in range(frame + 1)]
-        self.robot_trail_line.set_data(trajectory_x, trajectory_y)
-        
-        # 更新动态障碍物位置
-        for dyn_obs in self.dynamic_obstacle_patches:
-            obs_id = dyn_obs['obs_id']
-            if str(obs_id) in self.obstacle_trajectories:
-                obs_traj = self.obstacle_trajectories[str(obs_id)]
-                if frame < len(obs_traj):
-                    obs_pos = obs_traj[frame]
-                    
-                    if dyn_obs['type'] == 'circle':
-                        # 更新圆形障碍物中心
-                        dyn_obs['patch'].center = (obs_pos['x'], obs_pos['y'])
-                    elif dyn_obs['type'] == 'polygon':
-                        # 更新多边形障碍物位置
-                        # 计算位移
-                        initial_obs = self.initial_obstacles[obs_id]
-                        initial_center = initial_obs['initial_center']
-                        dx = obs_pos['x'] - initial_center[0]
-                        dy = obs_pos['y'] - initial_center[1]
-                        
-                        # 移动所有顶点
-                        initial_vertices = dyn_obs['initial_vertices']
-                        new_vertices_x = initial_vertices[0, :] + dx
-                        new_vertices_y = initial_vertices[1, :] + dy
-                        new_polygon_points = list(zip(new_vertices_x, new_vertices_y))
-                        dyn_obs['patch'].set_xy(new_polygon_points)
-        
-        # 更新信息文本
-        info_text = f"Step: {frame + 1}/{len(self.robot_trajectory)}\n"
-        if frame < len(self.actions):
-            action = self.actions[frame]
-            info_text += f"Linear: {action['linear']:.3f} m/s\n"
-            info_text += f"Angular: {action['angular']:.3f} rad/s"
-        self.info_text.set_text(info_text)
-        
-        # 更新waypoint标记
-        if frame < len(self.waypoints) and self.waypoints[frame] is not None:
-            waypoint = self.waypoints[frame]
-            if isinstance(waypoint, (list, tuple)) and len(waypoint) >= 2:
-                self.waypoint_marker.set_data([waypoint[0]], [waypoint[1]])
-            else:
-                self.waypoint_marker.set_data([], [])
-        else:
-            self.waypoint_marker.set_data([], [])
+        self.robot_direction_line.set_data(self._heading_xs[frame], self._heading_ys[frame])
         
-        # 返回所有更新的对象
-        artists = [self.robot_patch, self.robot_direction_line, self.robot_trail_line,
-                   self.info_text, self.waypoint_marker]
+        # 更新已走过的轨迹（数组切片是视图，不产生拷贝）
+        self.robot_trail_line.set_data(self._traj_x[:frame + 1], self._traj_y[:frame + 1])
         
-        for dyn_obs in self.dynamic_obstacle_patches:
-            artists.append(dyn_obs['patch'])
+        # 更新动态障碍物位置（取预先计算好的该帧顶点/中心，轨迹结束后保持最后的位置）
+        # 只取决于帧号，不依赖上一帧的状态，因此各帧可以乱序/并行渲染
+        self._update_dynamic_obstacles(frame)
         
-        return artists
+        # 更新信息文本（预先格式化好的）
+        self.info_text.set_text(self._info_texts[frame])
+        
+        # 更新waypoint标记（没有waypoint的帧为NaN，不绘制）
+        self.waypoint_marker.set_data(self._waypoint_xy[frame, 0:1], self._waypoint_xy[frame, 1:2])
+        
+        # 返回所有更新的对象
+        return self._animated_artists()
     
     def create_animation(self, save=True, show=False):
         """创建动画"""
@@ -322,231 +715,202 @@ class EpisodeVisualizer:
         # 创建figure和axis
         self.fig, self.ax = plt.subplots(figsize=(12, 10))
         
-        # 设置动画（使用blit=True加速）
-        num_frames = len(self.robot_trajectory)
-        anim = FuncAnimation(self.fig, self.update_animation, 
-                           init_func=self.init_animation,
-                           frames=num_frames,
-                           interval=1000/self.fps,
-                           blit=True,  # 启用blit加速
-                           repeat=True)
+        # 每一帧直接对应原始轨迹索引，抽帧后信息文本和已走轨迹仍按真实步数显示
+        self._frame_idx = self._frame_indices()
+        num_frames = len(self._frame_idx)
+        if num_frames < self.num_steps:
+            print(f"共 {self.num_steps} 个轨迹点，抽取其中 {num_frames} 帧渲染")
         
-        # 保存动画
+        # 保存动画：直接逐帧在Agg画布上重绘并取出像素交给编码器，
+        # 不经过FuncAnimation.save（每帧savefig）和PillowWriter（所有RGBA帧留在内存中）
         if save and self.output_path:
             print(f"保存动画到: {self.output_path}")
+            dpi = self._export_dpi()
             
             # 创建进度条
             pbar = tqdm(total=num_frames, desc="生成动画", unit="帧", ncols=80)
-            
-            # 进度回调函数
-            def progress_callback(current_frame, total_frames):
-                pbar.update(1)
-            
-            if self.output_path.endswith('.gif'):
-                writer = PillowWriter(fps=self.fps)
-                try:
-                    anim.save(self.output_path, writer=writer, dpi=80, 
-                             progress_callback=progress_callback)
-                except TypeError:
-                    # 旧版本matplotlib不支持progress_callback
-                    pbar.close()
-                    pbar = tqdm(total=num_frames, desc="生成动画 (无法显示精确进度)", 
-                               unit="帧", ncols=80, disable=True)
-                    print(f"正在处理 {num_frames} 帧...")
-                    anim.save(self.output_path, writer=writer, dpi=80)
-            elif self.output_path.endswith('.mp4'):
-                try:
-                    from matplotlib.animation import FFMpegWriter
-                    writer = FFMpegWriter(fps=self.fps, bitrate=1800)
-                    try:
-                        anim.save(self.output_path, writer=writer, dpi=80,
-                                 progress_callback=progress_callback)
-                    except TypeError:
-                        pbar.close()
-                        pbar = tqdm(total=num_frames, desc="生成动画 (无法显示精确进度)", 
-                                   unit="帧", ncols=80, disable=True)
-                        print(f"正在处理 {num_frames} 帧...")
-                        anim.save(self.output_path, writer=writer, dpi=80)
-                except Exception as e:
-                    pbar.close()
-                    print(f"警告: 无法保存为mp4格式，请安装ffmpeg。错误: {e}")
-                    print("尝试保存为gif格式...")
-                    gif_path = self.output_path.replace('.mp4', '.gif')
-                    
-                    # 重新创建进度条
-                    pbar = tqdm(total=num_frames, desc="生成GIF", unit="帧", ncols=80)
-                    writer = PillowWriter(fps=self.fps)
-                    try:
-                        anim.save(gif_path, writer=writer, dpi=80,
-                                 progress_callback=progress_callback)
-                    except TypeError:
-                        pbar.close()
-                        print(f"正在处理 {num_frames} 帧...")
-                        anim.save(gif_path, writer=writer, dpi=80)
-                    print(f"已保存为: {gif_path}")
+            try:
+                self._save_animation(self.output_path, self._frame_idx, pbar, dpi)
+            except Exception as e:
+                if not self.output_path.endswith('.mp4'):
+                    raise
+                pbar.close()
+                print(f"警告: 无法保存为mp4格式，请安装ffmpeg。错误: {e}")
+                print("尝试保存为gif格式...")
+                gif_path = self.output_path.replace('.mp4', '.gif')
+                
+                # 重新创建进度条
+                pbar = tqdm(total=num_frames, desc="生成GIF", unit="帧", ncols=80)
+                self._save_animation(gif_path, self._frame_idx, pbar, dpi)
+                print(f"已保存为: {gif_path}")
             
             pbar.close()
             print("动画保存完成!")
         
-        # 显示动画
+        # 显示动画（使用blit=True加速）
+        anim = None
         if show:
+            anim = FuncAnimation(self.fig, self.update_animation, 
+                               init_func=self.init_animation,
+                               frames=self._frame_idx,
+                               interval=1000/self.fps,
+                               blit=True,  # 启用blit加速
+                               repeat=True)
             plt.show()
+            # 窗口关闭后figure不再复用
+            self.fig = self.ax = None
         else:
-            plt.close()
+            # 从pyplot中注销，figure本身保留给create_static_plot复用
+            plt.close(self.fig)
         
         return anim
     
-    def create_static_plot(self, output_path=None):
-        """创建静态图（显示完整轨迹）"""
-        print("创建静态图...")
+    def _render_frames(self, frames, pbar=None):
+        """
+        逐帧更新artist并直接在Agg画布上重绘，生成RGBA帧
         
-        fig, ax = plt.subplots(figsize=(12, 10))
+        生成的数组是画布缓冲区的视图，绘制下一帧时会被覆盖，使用方需在迭代中立即消费。
+        需要RGB的使用方自行取[..., :3]，写入ffmpeg管道时直接使用RGBA，不做复制。
+        """
+        canvas = self.fig.canvas
+        self.init_animation()
+        for frame in frames:
+            self.update_animation(frame)
+            canvas.draw()
+            yield np.asarray(canvas.buffer_rgba())
+            if pbar is not None:
+                pbar.update(1)
+    
+    def _render_frames_parallel(self, frames, dpi, pbar=None):
+        """
+        用进程池并行渲染帧，按帧顺序生成RGB帧
         
-        # 计算场景范围
-        all_x = [pos['x'] for pos in self.robot_trajectory]
-        all_y = [pos['y'] for pos in self.robot_trajectory]
+        每个工作进程在初始化时拿到一份可视化数据（不含matplotlib对象）并创建自己的画布，
+        之后只按帧号渲染；imap保持顺序，主进程可以边接收边编码。
+        """
+        with mp.Pool(self.workers, initializer=_init_frame_worker, initargs=(self, dpi)) as pool:
+            for frame in pool.imap(_render_frame_worker, frames, chunksize=8):
+                yield frame
+                if pbar is not None:
+                    pbar.update(1)
+    
+    def _save_animation(self, output_path, frames, pbar=None, dpi=80):
+        """
+        把动画逐帧渲染并写入文件
         
-        for obs in self.initial_obstacles:
-            center = obs['initial_center']
-            all_x.append(center[0])
-            all_y.append(center[1])
+        gif由Pillow逐帧量化后统一编码（快速八叉树量化）；mp4优先用imageio（ffmpeg）写入，未安装imageio时
+        直接通过管道写入ffmpeg子进程。两者都与gif共用同一个帧生成器，workers大于1时用多进程并行渲染帧。
         
-        margin = 5.0
-        x_min, x_max = min(all_x) - margin, max(all_x) + margin
-        y_min, y_max = min(all_y) - margin, max(all_y) + margin
+        Args:
+            output_path: 输出路径（.gif或.mp4）
+            frames: 要渲染的轨迹索引序列
+            pbar: 进度条（可选）
+            dpi: 输出分辨率
+        """
+        orig_dpi = self.fig.get_dpi()
+        self.fig.set_dpi(dpi)
+        try:
+            if self.workers > 1:
+                images = self._render_frames_parallel(frames, dpi, pbar)
+            else:
+                images = self._render_frames(frames, pbar)
+            
+            if output_path.endswith('.mp4'):
+                if imageio is not None:
+                    with imageio.get_writer(output_path, fps=self.fps, codec='libx264',
+                                            bitrate='1800k', macro_block_size=1) as writer:
+                        for image in images:
+                            writer.append_data(image[..., :3])
+                else:
+                    _write_mp4_ffmpeg(output_path, images, self.fps)
+            else:
+                # Pillow按顺序消费生成器并逐帧量化，但会把量化后的调色板帧全部保存在列表中，
+                # 循环结束后才写入文件，因此所有帧同时留在内存中（每像素1字节，约为RGB帧的1/3）。
+                # Pillow默认用中位切分把RGB帧量化为调色板，这是GIF编码的主要开销，
+                # 改用快速八叉树量化（不抖动），速度快数倍且颜色误差相当
+                pil_images = (Image.fromarray(image[..., :3]).quantize(method=Image.FASTOCTREE, dither=Image.NONE)
+                              for image in images)
+                first = next(pil_images)
+                first.save(output_path, save_all=True, append_images=pil_images,
+                           duration=int(1000 / self.fps), loop=0)
+        finally:
+            self.fig.set_dpi(orig_dpi)
+    
+    def create_static_plot(self, output_path=None):
+        """创建静态图（显示完整轨迹）"""
+        print("创建静态图...")
         
-        ax.set_xlim(x_min, x_max)
-        ax.set_ylim(y_min, y_max)
-        ax.set_aspect('equal')
-        ax.grid(True, alpha=0.3)
-        ax.set_xlabel('X (m)', fontsize=12)
-        ax.set_ylabel('Y (m)', fontsize=12)
+        # 之前导出过动画时直接复用动画的figure（清空坐标轴），不再新建figure
+        if self.fig is not None:
+            fig, ax = self.fig, self.ax
+            ax.clear()
+            self.fig = self.ax = None
+        else:
+            fig, ax = plt.subplots(figsize=(12, 10))
         
-        title = f"Complete Trajectory - {self.metadata.get('status', 'Unknown')}"
-        if self.metadata.get('success', 0) > 0.5:
-            title += " ✓"
-        ax.set_title(title, fontsize=14, fontweight='bold')
+        # 场景范围、标签和标题（与动画共用）
+        self._apply_axes(ax, "Complete Trajectory")
         
-        # 绘制障碍物（区分静态和动态）
-        static_label_added = False
-        dynamic_label_added = False
+        # 静态障碍物（红色），与动画共用
+        self._draw_static_scene(ax, label='Static Obstacles')
         
-        for obs in self.initial_obstacles:
-            # 检查是否真的是动态障碍物（通过轨迹数据判断）
-            is_dynamic = obs.get('is_dynamic', False)
+        # 动态障碍物按类别合并为Collection批量绘制
+        dynamic_initial_patches = []
+        dynamic_final_patches = []
+        dynamic_paths = []
+        
+        for obs, is_dynamic in zip(self.initial_obstacles, self._obstacle_is_dynamic):
+            if not is_dynamic:
+                continue
             
-            # 如果没有明确标记，通过轨迹数据自动判断
-            if not is_dynamic and str(obs['id']) in self.obstacle_trajectories:
-                obs_traj = self.obstacle_trajectories[str(obs['id'])]
-                if len(obs_traj) > 1:
-                    # 检查起始和结束位置是否有显著变化
-                    start_pos = obs_traj[0]
-                    end_pos = obs_traj[-1]
-                    distance_moved = np.sqrt(
-                        (end_pos['x'] - start_pos['x'])**2 + 
-                        (end_pos['y'] - start_pos['y'])**2
-                    )
-                    # 如果移动距离超过0.1米，认为是动态障碍物
-                    if distance_moved > 0.1:
-                        is_dynamic = True
+            patch = self._make_obstacle_patch(obs)
+            if patch is None:
+                continue
             
-            if 'vertices' in obs and obs['vertices']:
-                vertices = np.array(obs['vertices'])
-                if vertices.ndim == 2 and vertices.shape[0] == 2:
-                    polygon_points = list(zip(vertices[0, :], vertices[1, :]))
-                    
-                    if is_dynamic:
-                        # 动态障碍物 - 绘制初始和最终位置
-                        # 初始位置（淡橙色）
-                        polygon = patches.Polygon(polygon_points, 
-                                                 facecolor='orange', alpha=0.2, 
-                                                 edgecolor='darkorange', linewidth=1, linestyle='--',
-                                                 label='Dynamic Obstacles' if not dynamic_label_added else '')
-                        ax.add_patch(polygon)
-                        
-                        # 如果有轨迹，绘制最终位置（深橙色）
-                        if str(obs['id']) in self.obstacle_trajectories:
-                            obs_traj = self.obstacle_trajectories[str(obs['id'])]
-                            if len(obs_traj) > 0:
-                                final_pos = obs_traj[-1]
-                                initial_center = obs['initial_center']
-                                dx = final_pos['x'] - initial_center[0]
-                                dy = final_pos['y'] - initial_center[1]
-                                
-                                final_vertices_x = vertices[0, :] + dx
-                                final_vertices_y = vertices[1, :] + dy
-                                final_polygon_points = list(zip(final_vertices_x, final_vertices_y))
-                                
-                                final_polygon = patches.Polygon(final_polygon_points, 
-                                                               facecolor='orange', alpha=0.4, 
-                                                               edgecolor='darkorange', linewidth=2)
-                                ax.add_patch(final_polygon)
-                        
-                        dynamic_label_added = True
-                    else:
-                        # 静态障碍物（红色）
-                        polygon = patches.Polygon(polygon_points, 
-                                                 facecolor='red', alpha=0.3, 
-                                                 edgecolor='darkred', linewidth=2,
-                                                 label='Static Obstacles' if not static_label_added else '')
-                        ax.add_patch(polygon)
-                        static_label_added = True
-            else:
-                # 圆形障碍物
-                radius = obs.get('radius', 0.5)
-                center = obs['initial_center']
-                
-                if is_dynamic:
-                    # 动态障碍物 - 绘制初始和最终位置
-                    # 初始位置（淡橙色）
-                    circle = patches.Circle((center[0], center[1]), radius,
-                                           facecolor='orange', alpha=0.2,
-                                           edgecolor='darkorange', linewidth=1, linestyle='--',
-                                           label='Dynamic Obstacles' if not dynamic_label_added else '')
-                    ax.add_patch(circle)
-                    
-                    # 如果有轨迹，绘制最终位置和运动轨迹
-                    if str(obs['id']) in self.obstacle_trajectories:
-                        obs_traj = self.obstacle_trajectories[str(obs['id'])]
-                        if len(obs_traj) > 0:
-                            # 绘制运动轨迹
-                            traj_x = [p['x'] for p in obs_traj]
-                            traj_y = [p['y'] for p in obs_traj]
-                            ax.plot(traj_x, traj_y, 'orange', linewidth=1, alpha=0.5, linestyle=':')
-                            
-                            # 最终位置（深橙色）
-                            final_pos = obs_traj[-1]
-                            final_circle = patches.Circle((final_pos['x'], final_pos['y']), radius,
-                                                         facecolor='orange', alpha=0.4,
-                                                         edgecolor='darkorange', linewidth=2)
-                            ax.add_patch(final_circle)
-                    
-                    dynamic_label_added = True
+            # 动态障碍物 - 初始位置，以及有轨迹时的最终位置
+            dynamic_initial_patches.append(patch)
+            obs_xy = self._obs_xy.get(obs['id'])
+            if obs_xy is not None and len(obs_xy) > 0:
+                final_x, final_y = obs_xy[-1]
+                if isinstance(patch, patches.Circle):
+                    # 圆形障碍物还绘制运动轨迹
+                    dynamic_paths.append(obs_xy)
+                    dynamic_final_patches.append(
+                        self._make_obstacle_patch(obs, center=(final_x, final_y)))
                 else:
-                    # 静态障碍物（红色）
-                    circle = patches.Circle((center[0], center[1]), radius,
-                                           facecolor='red', alpha=0.3,
-                                           edgecolor='darkred', linewidth=2,
-                                           label='Static Obstacles' if not static_label_added else '')
-                    ax.add_patch(circle)
-                    static_label_added = True
+                    initial_center = obs['initial_center']
+                    dx = final_x - initial_center[0]
+                    dy = final_y - initial_center[1]
+                    dynamic_final_patches.append(patches.Polygon(obs['_polygon_points'] + (dx, dy)))
+        
+        if dynamic_initial_patches:
+            # 动态障碍物初始位置（淡橙色）
+            ax.add_collection(PatchCollection(
+                dynamic_initial_patches, facecolor='orange', alpha=0.2,
+                edgecolor='darkorange', linewidths=1, linestyles='--',
+                label='Dynamic Obstacles'))
+        if dynamic_paths:
+            # 动态障碍物运动轨迹
+            ax.add_collection(LineCollection(
+                dynamic_paths, colors='orange', linewidths=1, alpha=0.5, linestyles=':'))
+        if dynamic_final_patches:
+            # 动态障碍物最终位置（深橙色）
+            ax.add_collection(PatchCollection(
+                dynamic_final_patches, facecolor='orange', alpha=0.4,
+                edgecolor='darkorange', linewidths=2))
         
         # 绘制完整轨迹
-        trajectory_x = [pos['x'] for pos in self.robot_trajectory]
-        trajectory_y = [pos['y'] for pos in self.robot_trajectory]
-        ax.plot(trajectory_x, trajectory_y, 'b-', 
+        ax.plot(self._traj_x, self._traj_y, 'b-', 
                 linewidth=2, alpha=0.8, label='Robot Path')
         
         # 绘制起点和终点
-        start_pos = self.robot_trajectory[0]
-        end_pos = self.robot_trajectory[-1]
-        ax.plot(start_pos['x'], start_pos['y'], 
+        ax.plot(self._traj_x[0], self._traj_y[0], 
                 'go', markersize=15, label='Start')
-        ax.plot(end_pos['x'], end_pos['y'], 
+        ax.plot(self._traj_x[-1], self._traj_y[-1], 
                 'r*', markersize=20, label='End')
         
         # 添加信息文本
-        info_text = f"Total Steps: {len(self.robot_trajectory)}\n"
+        info_text = f"Total Steps: {self.num_steps}\n"
         info_text += f"Duration: {self.metadata.get('duration', 0):.2f}s\n"
         info_text += f"Success: {self.metadata.get('success', 0):.1f}\n"
         info_text += f"Collisions: {self.metadata.get('collision_count', 0)}"
@@ -560,10 +924,10 @@ class EpisodeVisualizer:
         ax.legend(loc='upper right', fontsize=10)
         
         if output_path:
-            plt.savefig(output_path, dpi=150, bbox_inches='tight')
+            fig.savefig(output_path, dpi=150, bbox_inches='tight')
             print(f"静态图已保存到: {output_path}")
         
-        plt.close()
+        plt.close(fig)
 
 
 def main():
@@ -580,8 +944,23 @@ def main():
                        help="显示动画窗口")
     parser.add_argument("--no_save", action='store_true',
                        help="不保存动画文件")
+    parser.add_argument("--workers", type=int, default=1,
+                       help="并行渲染动画帧的进程数（默认1，即单进程）")
+    parser.add_argument("--max_frames", type=int, default=None,
+                       help="动画最多渲染的帧数，轨迹更长时均匀抽帧（默认渲染全部轨迹点）")
+    parser.add_argument("--subsample", type=int, default=1,
+                       help="每隔N个轨迹点渲染一帧（默认1，即每个轨迹点都渲染）")
+    parser.add_argument("--max_size", type=int, default=None,
+                       help="保存的动画长边最多的像素数，超过时降低dpi（默认不限制，使用80dpi，即960像素）")
     
     args = parser.parse_args()
+    if args.max_frames is not None and args.max_frames < 1:
+        parser.error("--max_frames 必须大于等于1")
+    
+    # 只导出文件时不需要GUI：在创建任何figure之前切换到Agg后端，省去GUI事件循环的开销
+    # （交互显示需要--show，此时保持默认的GUI后端）
+    if not args.show:
+        plt.switch_backend('Agg')
     
     # 检查输入文件
     if not Path(args.input).exists():
@@ -598,7 +977,11 @@ def main():
     visualizer = EpisodeVisualizer(
         episode_data_path=args.input,
         output_path=output_path,
-        fps=args.fps
+        fps=args.fps,
+        workers=args.workers,
+        max_frames=args.max_frames,
+        subsample=args.subsample,
+        max_size=args.max_size
     )
     
     # 创建动画
@@ -610,7 +993,7 @@ def main():
         visualizer.create_static_plot(output_path=args.static)
     
     print("\n验证完成!")
-    print(f"机器人轨迹点数: {len(visualizer.robot_trajectory)}")
+    print(f"机器人轨迹点数: {visualizer.num_steps}")
     print(f"障碍物数量: {len(visualizer.initial_obstacles)}")
     print(f"任务状态: {visualizer.metadata.get('status', 'Unknown')}")
     print(f"成功: {visualizer.metadata.get('success', 0)}")